@@ -5,24 +5,26 @@ MAX Messenger Bot - Polling Mode (Local Development)
 """
 
 import asyncio
+import inspect
 import logging
-from datetime import datetime
 from typing import Optional, Dict, Any
 
+import aiohttp
 from maxapi import MaxAPI, Message, Update
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Base, User
+from database.engine import AsyncSessionLocal, init_db, dispose_engine
+from database.models import User
 from database.queries import (
-    add_user, get_user, create_referral_link, 
+    add_user, ensure_users, get_user, create_referral_link, 
     log_referral, get_user_stats, get_top_referrers,
     get_all_users, update_user_points
 )
-from utils.config import Config
+from utils.cache import LRUCache
+from utils.config import CONFIG
 from utils.validators import (
     is_valid_username, is_valid_referral_code,
-    sanitize_message, validate_chat_id
+    sanitize_message, is_valid_chat_id
 )
 from utils.link_generator import (
     generate_referral_link, extract_referral_code,
@@ -36,37 +38,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Config
-config = Config()
+# Static replies
+_WELCOME_TEXT = (
+    "👋 Добро пожаловать!\n\n"
+    "Это бот MAX Messenger.\n\n"
+    "Команды:\n"
+    "/help - справка\n"
+    "/ref - реф-ссылка\n"
+    "/stats - статистика"
+)
 
-# Database setup
-engine = None
-AsyncSessionLocal = None
-bot = None
+_HELP_TEXT = (
+    "📖 Справка\n\n"
+    "/start - начать\n"
+    "/help - эта справка\n"
+    "/ref - получить реф-ссылку\n"
+    "/stats - посмотреть статистику\n\n"
+    "Введи реф-код для бонуса!"
+)
 
+# Update pipeline - prefetched updates waiting for a worker (split evenly
+# between worker queues), and the number of workers (bounds concurrent
+# handlers so the DB pool isn't exhausted)
+UPDATE_QUEUE_SIZE = 256
+UPDATE_WORKERS = 8
 
-async def init_db():
-    """Initialize database"""
-    global engine, AsyncSessionLocal
-    
-    db_url = config.DATABASE_URL
-    if db_url.startswith('sqlite:///'):
-        db_url = db_url.replace('sqlite:///', 'sqlite+aiosqlite:///')
-    
-    engine = create_async_engine(
-        db_url,
-        echo=False,
-        future=True
-    )
-    
-    AsyncSessionLocal = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    logger.info("✅ Database initialized")
+# Seconds to finish already fetched updates on shutdown
+SHUTDOWN_DRAIN_TIMEOUT = 10
+
+# Chat IDs already registered - repeat messages skip the DB upsert
+_known_users = LRUCache(maxsize=10_000)
+
+# API client
+bot = None
+http_session = None
 
 
 async def get_db():
@@ -75,37 +80,15 @@ async def get_db():
         yield session
 
 
-async def handle_start(chat_id: str, username: str = None):
+async def handle_start(chat_id: str):
     """Handle /start command"""
     try:
-        # Check user exists
-        async with AsyncSessionLocal() as session:
-            user = await get_user(session, chat_id)
-            
-            if not user:
-                # New user - register
-                new_user = await add_user(
-                    session, 
-                    chat_id, 
-                    username or f"user_{chat_id[:8]}"
-                )
-                logger.info(f"✅ New user registered: {chat_id}")
-            
-            # Send welcome
-            message = (
-                "👋 Добро пожаловать!\n\n"
-                "Это бот MAX Messenger.\n\n"
-                "Команды:\n"
-                "/help - справка\n"
-                "/ref - реф-ссылка\n"
-                "/stats - статистика"
-            )
-            
-            await bot.send_message(
-                chat_id=chat_id,
-                text=message
-            )
-            logger.info(f"✅ Welcome sent to {chat_id}")
+        # User is already registered by register_senders
+        await bot.send_message(
+            chat_id=chat_id,
+            text=_WELCOME_TEXT
+        )
+        logger.info(f"✅ Welcome sent to {chat_id}")
     
     except Exception as e:
         logger.error(f"❌ Error in /start: {e}")
@@ -114,72 +97,73 @@ async def handle_start(chat_id: str, username: str = None):
 async def handle_help(chat_id: str):
     """Handle /help command"""
     try:
-        message = (
-            "📖 Справка\n\n"
-            "/start - начать\n"
-            "/help - эта справка\n"
-            "/ref - получить реф-ссылку\n"
-            "/stats - посмотреть статистику\n\n"
-            "Введи реф-код для бонуса!"
-        )
-        
-        await bot.send_message(chat_id=chat_id, text=message)
+        await bot.send_message(chat_id=chat_id, text=_HELP_TEXT)
         logger.info(f"✅ Help sent to {chat_id}")
     
     except Exception as e:
         logger.error(f"❌ Error in /help: {e}")
 
 
-async def handle_ref(chat_id: str):
+async def handle_ref(session: AsyncSession, chat_id: str):
     """Handle /ref command"""
     try:
-        async with AsyncSessionLocal() as session:
-            user = await get_user(session, chat_id)
+        user = await get_user(session, chat_id)
+        
+        if user:
+            ref_link = generate_referral_link(
+                user.user_id,
+                CONFIG.BOT_NAME
+            )
             
-            if user:
-                ref_link = generate_referral_link(
-                    user.user_id,
-                    config.BOT_NAME
-                )
-                
-                message = (
-                    f"🔗 Твоя реф-ссылка:\n\n"
-                    f"`{ref_link}`\n\n"
-                    f"Приглашай друзей и получай баллы!"
-                )
-                
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    parse_mode='Markdown'
-                )
-                logger.info(f"✅ Ref link sent to {chat_id}")
+            message = f"🔗 Твоя реф-ссылка:\n\n`{ref_link}`\n\nПриглашай друзей и получай баллы!"
+            
+            await bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode='Markdown'
+            )
+            logger.info(f"✅ Ref link sent to {chat_id}")
     
     except Exception as e:
         logger.error(f"❌ Error in /ref: {e}")
 
 
-async def handle_stats(chat_id: str):
+async def handle_stats(session: AsyncSession, chat_id: str):
     """Handle /stats command"""
     try:
-        async with AsyncSessionLocal() as session:
-            stats = await get_user_stats(session, chat_id)
-            
-            message = (
-                f"📊 Твоя статистика:\n\n"
-                f"👤 ID: {chat_id}\n"
-                f"⭐ Баллы: {stats.get('points', 0)}\n"
-                f"👥 Рефералов: {stats.get('referrals', 0)}\n"
-                f"📅 Дата присоединения: {stats.get('joined_date', 'N/A')}\n"
-            )
-            
-            await bot.send_message(chat_id=chat_id, text=message)
-            logger.info(f"✅ Stats sent to {chat_id}")
+        stats = await get_user_stats(session, chat_id)
+        
+        message = (
+            f"📊 Твоя статистика:\n\n"
+            f"👤 ID: {chat_id}\n"
+            f"⭐ Баллы: {stats.get('points', 0)}\n"
+            f"👥 Рефералов: {stats.get('referrals', 0)}\n"
+            f"📅 Дата присоединения: {stats.get('joined_date') or 'N/A'}\n"
+        )
+        
+        await bot.send_message(chat_id=chat_id, text=message)
+        logger.info(f"✅ Stats sent to {chat_id}")
     
     except Exception as e:
         logger.error(f"❌ Error in /stats: {e}")
 
 
+async def handle_referral_code(session: AsyncSession, chat_id: str, ref_code: str):
+    """Handle referral code message"""
+    result = await log_referral(session, chat_id, ref_code)
+    if result:
+        await bot.send_message(
+            chat_id=chat_id,
+            text="✅ Код принят! +10 баллов"
+        )
+        logger.info(f"✅ Referral logged: {chat_id} from {ref_code}")
+    else:
+        await bot.send_message(
+            chat_id=chat_id,
+            text="❌ Код не найден"
+        )
+
+
 async def handle_message(update: Update):
     """Handle incoming message"""
     try:
@@ -187,70 +171,139 @@ async def handle_message(update: Update):
             return
         
         chat_id = str(update.message.chat_id)
-        username = update.message.from_user.username if update.message.from_user else None
         text = update.message.text or ""
         
-        if not validate_chat_id(chat_id):
+        if not is_valid_chat_id(chat_id):
             logger.warning(f"⚠️ Invalid chat_id: {chat_id}")
             return
         
         logger.info(f"📨 Message from {chat_id}: {text[:50]}")
         
-        # Register user if not exists
+        # User is already registered by register_senders
+        # One session (one pool checkout) for the whole message
         async with AsyncSessionLocal() as session:
-            user = await get_user(session, chat_id)
-            if not user:
-                await add_user(session, chat_id, username or f"user_{chat_id[:8]}")
-        
-        # Handle commands
-        if text.startswith('/start'):
-            await handle_start(chat_id, username)
-        
-        elif text.startswith('/help'):
-            await handle_help(chat_id)
-        
-        elif text.startswith('/ref'):
-            await handle_ref(chat_id)
-        
-        elif text.startswith('/stats'):
-            await handle_stats(chat_id)
-        
-        # Handle referral code
-        elif len(text.strip()) > 0 and is_valid_referral_code(text.strip()):
-            ref_code = text.strip()
-            async with AsyncSessionLocal() as session:
-                result = await log_referral(session, chat_id, ref_code)
-                if result:
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text="✅ Код принят! +10 баллов"
-                    )
-                    logger.info(f"✅ Referral logged: {chat_id} from {ref_code}")
-                else:
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text="❌ Код не найден"
-                    )
-        
-        # Echo
-        else:
-            sanitized = sanitize_message(text)
-            await bot.send_message(
-                chat_id=chat_id,
-                text=f"📝 Ты написал: {sanitized}"
-            )
+            # Handle commands
+            if text.startswith('/start'):
+                await handle_start(chat_id)
+            
+            elif text.startswith('/help'):
+                await handle_help(chat_id)
+            
+            elif text.startswith('/ref'):
+                await handle_ref(session, chat_id)
+            
+            elif text.startswith('/stats'):
+                await handle_stats(session, chat_id)
+            
+            # Handle referral code
+            elif len(text.strip()) > 0 and is_valid_referral_code(text.strip()):
+                await handle_referral_code(session, chat_id, text.strip())
+            
+            # Echo
+            else:
+                sanitized = sanitize_message(text)
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"📝 Ты написал: {sanitized}"
+                )
     
     except Exception as e:
         logger.error(f"❌ Error handling message: {e}")
 
 
+async def register_senders(updates: list):
+    """Register new senders of a polling batch in one transaction"""
+    new_users = {}
+    for update in updates:
+        if not update.message:
+            continue
+        
+        chat_id = str(update.message.chat_id)
+        if chat_id in _known_users or not is_valid_chat_id(chat_id):
+            continue
+        
+        from_user = update.message.from_user
+        new_users[chat_id] = from_user.username if from_user else None
+    
+    if not new_users:
+        return
+    
+    async with AsyncSessionLocal() as session:
+        added = await ensure_users(session, new_users)
+    
+    for chat_id in new_users:
+        _known_users[chat_id] = True
+    
+    if added:
+        logger.info(f"✅ New users registered: {added}")
+
+
+def _queue_for(queues: list, update: Update) -> asyncio.Queue:
+    """Pick the worker queue for an update - same chat, same worker"""
+    chat_id = str(update.message.chat_id) if update.message else None
+    return queues[hash(chat_id) % len(queues)]
+
+
+async def fetch_updates(queues: list):
+    """Long-poll updates and push them to the worker queues"""
+    offset = 0
+    
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30)
+            
+            if updates:
+                try:
+                    await register_senders(updates)
+                except Exception as e:
+                    logger.error(f"❌ Error registering users: {e}")
+                
+                # One chat's updates go to one worker, so they are
+                # handled in order and never concurrently
+                for update in updates:
+                    await _queue_for(queues, update).put(update)
+                offset = updates[-1].update_id + 1
+        
+        except Exception as e:
+            logger.error(f"❌ Polling error: {e}")
+            await asyncio.sleep(5)
+
+
+async def process_updates(queue: asyncio.Queue):
+    """Handle queued updates"""
+    while True:
+        update = await queue.get()
+        try:
+            await handle_message(update)
+        except Exception as e:
+            logger.error(f"❌ Error processing update: {e}")
+        finally:
+            queue.task_done()
+
+
+def _client_accepts_session() -> bool:
+    """Check if the API client takes an external HTTP session"""
+    try:
+        return 'session' in inspect.signature(MaxAPI).parameters
+    except (TypeError, ValueError):
+        return False
+
+
 async def polling_loop():
     """Main polling loop"""
-    global bot
+    global bot, http_session
     
     await init_db()
     
-    bot = MaxAPI(token=config.BOT_TOKEN)
+    # One keep-alive HTTP session for all outbound API calls, if the client
+    # can use it - otherwise it manages its own connections
+    if _client_accepts_session():
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=30)
+        )
+        bot = MaxAPI(token=CONFIG.BOT_TOKEN, session=http_session)
+    else:
+        bot = MaxAPI(token=CONFIG.BOT_TOKEN)
     
     logger.info("╔════════════════════════════════════════╗")
     logger.info("║   MAX MESSENGER BOT - POLLING MODE     ║")
@@ -258,10 +311,10 @@ async def polling_loop():
     logger.info("╚════════════════════════════════════════╝")
     logger.info("")
     logger.info("============================================")
-    logger.info(f"🤖 Bot: {config.BOT_NAME}")
-    logger.info(f"💾 Database: {config.DATABASE_URL}")
+    logger.info(f"🤖 Bot: {CONFIG.BOT_NAME}")
+    logger.info(f"💾 Database: {CONFIG.DATABASE_URL}")
     logger.info("✅ Database initialized")
-    logger.info("✅ Bot initialized: " + config.BOT_NAME)
+    logger.info("✅ Bot initialized: " + CONFIG.BOT_NAME)
     logger.info("🚀 Bot started in polling mode")
     logger.info("⏳ Waiting for messages...")
     logger.info("============================================")
@@ -271,24 +324,34 @@ async def polling_loop():
     logger.info("🛑 Ctrl+C для остановки")
     logger.info("")
     
-    offset = 0
+    # Fetching and handling overlap: one poller feeds a queue per worker
+    queues = [
+        asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE // UPDATE_WORKERS)
+        for _ in range(UPDATE_WORKERS)
+    ]
+    workers = [
+        asyncio.create_task(process_updates(queue))
+        for queue in queues
+    ]
+    producer = asyncio.create_task(fetch_updates(queues))
     
-    while True:
+    try:
+        await producer
+    finally:
+        # Fetched updates are already acknowledged - handle them before exit
+        producer.cancel()
         try:
-            updates = await bot.get_updates(offset=offset, timeout=30)
-            
-            if updates:
-                for update in updates:
-                    try:
-                        await handle_message(update)
-                        offset = update.update_id + 1
-                    except Exception as e:
-                        logger.error(f"❌ Error processing update: {e}")
-                        offset = update.update_id + 1
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in queues)),
+                timeout=SHUTDOWN_DRAIN_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            pending = sum(queue.qsize() for queue in queues)
+            logger.warning(f"⚠️ Shutdown timeout, {pending} queued updates dropped")
         
-        except Exception as e:
-            logger.error(f"❌ Polling error: {e}")
-            await asyncio.sleep(5)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
 
 async def main():
@@ -300,8 +363,9 @@ async def main():
     except Exception as e:
         logger.error(f"❌ Fatal error: {e}")
     finally:
-        if engine:
-            await engine.dispose()
+        if http_session:
+            await http_session.close()
+        await dispose_engine()
 
 
 if __name__ == "__main__":
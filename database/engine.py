@@ -0,0 +1,82 @@
+"""
+Database Engine - Shared async engine and session factory
+"""
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database.models import Base
+from utils.config import CONFIG
+
+_engine = None
+
+# Session factory - bound to the engine on first get_engine() call
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+
+def get_database_url() -> str:
+    """Get database URL with async driver"""
+    db_url = CONFIG.DATABASE_URL
+    if db_url.startswith('sqlite:///'):
+        db_url = db_url.replace('sqlite:///', 'sqlite+aiosqlite:///')
+    return db_url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enable WAL, relaxed fsync and lock waiting on each new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Wait for a concurrent writer instead of failing with "database is locked"
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+
+def get_engine() -> AsyncEngine:
+    """Get shared engine, create it on first use"""
+    global _engine
+
+    if _engine is None:
+        db_url = get_database_url()
+
+        is_sqlite = db_url.startswith('sqlite')
+
+        # Long-lived pooled connections - no connect cost per session,
+        # and SQLite keeps its page cache warm. Only server connections
+        # can drop, so only they are pinged on checkout
+        _engine = create_async_engine(
+            db_url,
+            echo=False,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=20,
+            max_overflow=10,
+            pool_timeout=30,
+            pool_pre_ping=not is_sqlite,
+            pool_recycle=1800
+        )
+
+        if is_sqlite:
+            event.listen(_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+        AsyncSessionLocal.configure(bind=_engine)
+
+    return _engine
+
+
+async def init_db():
+    """Initialize database"""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def dispose_engine():
+    """Close all pooled connections"""
+    global _engine
+
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
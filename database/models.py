@@ -3,13 +3,34 @@ Database Models - SQLAlchemy ORM
 """
 
 from datetime import datetime
+
 from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 Base = declarative_base()
 
 
+class utcnow(FunctionElement):
+    """Current UTC time computed by the database, comparable to datetime.utcnow()"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _compile_utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "postgresql")
+def _compile_utcnow_postgresql(element, compiler, **kw):
+    # now() is in the session time zone - convert to naive UTC
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
 class User(Base):
     """User model"""
     __tablename__ = "users"
@@ -19,11 +40,19 @@ class User(Base):
     username = Column(String, nullable=True)
     points = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
-    joined_date = Column(DateTime, default=datetime.utcnow)
-    last_activity = Column(DateTime, default=datetime.utcnow)
+    joined_date = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
+    last_activity = Column(
+        DateTime, default=datetime.utcnow, server_default=utcnow(), onupdate=utcnow()
+    )
+    
+    # Identity by user_id (unique, not null) so session.get() works with chat IDs;
+    # eager defaults fetch the last_activity set by onupdate with the UPDATE
+    __mapper_args__ = {"eager_defaults": True, "primary_key": [user_id]}
     
     # Relationships
-    referrals = relationship("Referral", back_populates="referrer")
+    referrals = relationship(
+        "Referral", foreign_keys="Referral.referrer_id", back_populates="referrer"
+    )
     referral_links = relationship("ReferralLink", back_populates="user")
 
 
@@ -34,7 +63,7 @@ class ReferralLink(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
     ref_code = Column(String, unique=True, index=True, nullable=False)
-    created_date = Column(DateTime, default=datetime.utcnow)
+    created_date = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
     uses_count = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
     
@@ -47,10 +76,10 @@ class Referral(Base):
     __tablename__ = "referrals"
     
     id = Column(Integer, primary_key=True, index=True)
-    referrer_id = Column(String, ForeignKey("users.user_id"), nullable=False)
-    referred_user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    referrer_id = Column(String, ForeignKey("users.user_id"), nullable=False, index=True)
+    referred_user_id = Column(String, ForeignKey("users.user_id"), nullable=False, index=True)
     ref_code_used = Column(String, nullable=False)
-    created_date = Column(DateTime, default=datetime.utcnow)
+    created_date = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
     points_awarded = Column(Integer, default=10)
     
     # Relationships
@@ -63,12 +92,23 @@ class BroadcastMessage(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     message_text = Column(Text, nullable=False)
-    created_date = Column(DateTime, default=datetime.utcnow)
+    created_date = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
     sent_count = Column(Integer, default=0)
     total_count = Column(Integer, default=0)
     is_completed = Column(Boolean, default=False)
 
 
+class BroadcastRecipient(Base):
+    """Broadcast recipient model"""
+    __tablename__ = "broadcast_recipients"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcast_messages.id"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    is_sent = Column(Boolean, default=False)
+    sent_date = Column(DateTime, nullable=True)
+
+
 class AdminUser(Base):
     """Admin user model"""
     __tablename__ = "admin_users"
@@ -77,7 +117,7 @@ class AdminUser(Base):
     username = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
-    created_date = Column(DateTime, default=datetime.utcnow)
+    created_date = Column(DateTime, default=datetime.utcnow, server_default=utcnow())
     last_login = Column(DateTime, nullable=True)
 
 
@@ -90,4 +130,4 @@ class BotStatistics(Base):
     active_users = Column(Integer, default=0)
     total_referrals = Column(Integer, default=0)
     total_points_distributed = Column(Integer, default=0)
-    date = Column(DateTime, default=datetime.utcnow, index=True)
+    date = Column(DateTime, default=datetime.utcnow, server_default=utcnow(), index=True)
@@ -3,34 +3,34 @@ Database CRUD Operations
 """
 
 from datetime import datetime, timedelta
-from sqlalchemy import select, func, desc
+from typing import Optional
+from sqlalchemy import select, insert, update, func, desc, exists, lambda_stmt
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, raiseload
 
-from database.models import User, ReferralLink, Referral, BroadcastMessage
+from database.models import User, ReferralLink, Referral, BroadcastMessage, BroadcastRecipient
+from utils.cache import ttl_cache
 from utils.link_generator import generate_short_code, extract_referral_code
 
 
 async def add_user(session: AsyncSession, user_id: str, username: str = None) -> User:
     """Add new user"""
     try:
-        # Check if user exists
-        stmt = select(User).where(User.user_id == user_id)
-        result = await session.execute(stmt)
-        existing_user = result.scalar_one_or_none()
-        
-        if existing_user:
-            return existing_user
-        
-        # Create new user
-        new_user = User(
+        # Insert unless exists, new row comes back via RETURNING
+        stmt = _insert(session, User).values(
             user_id=user_id,
             username=username or f"user_{user_id[:8]}",
             points=0,
             is_active=True
-        )
-        session.add(new_user)
+        ).on_conflict_do_nothing(index_elements=[User.user_id]).returning(User)
+        result = await session.execute(stmt)
+        new_user = result.scalar_one_or_none()
         await session.commit()
-        await session.refresh(new_user)
+        
+        if new_user is None:
+            # Conflict - user already exists
+            return await get_user(session, user_id)
         
         return new_user
     
@@ -39,16 +39,50 @@ async def add_user(session: AsyncSession, user_id: str, username: str = None) ->
         raise e
 
 
+def _insert(session: AsyncSession, model):
+    """Dialect-specific INSERT with ON CONFLICT support"""
+    if session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+async def ensure_users(session: AsyncSession, users: dict) -> int:
+    """Register many users ({user_id: username}) in one statement, return number added"""
+    if not users:
+        return 0
+    
+    try:
+        stmt = _insert(session, User).values([
+            {
+                "user_id": user_id,
+                "username": username or f"user_{user_id[:8]}",
+                "points": 0,
+                "is_active": True
+            }
+            for user_id, username in users.items()
+        ]).on_conflict_do_nothing(index_elements=[User.user_id])
+        result = await session.execute(stmt)
+        await session.commit()
+        
+        return result.rowcount
+    
+    except Exception as e:
+        await session.rollback()
+        raise e
+
+
 async def get_user(session: AsyncSession, user_id: str) -> User:
-    """Get user by ID"""
-    stmt = select(User).where(User.user_id == user_id)
-    result = await session.execute(stmt)
-    return result.scalar_one_or_none()
+    """Get user by ID (served from the session identity map when loaded)"""
+    return await session.get(User, user_id)
 
 
 async def get_all_users(session: AsyncSession, limit: int = 100) -> list:
     """Get all users"""
-    stmt = select(User).limit(limit)
+    stmt = (
+        select(User)
+        .options(selectinload(User.referral_links), raiseload('*'))
+        .limit(limit)
+    )
     result = await session.execute(stmt)
     return result.scalars().all()
 
@@ -59,7 +93,6 @@ async def update_user_points(session: AsyncSession, user_id: str, points: int) -
         user = await get_user(session, user_id)
         if user:
             user.points += points
-            user.last_activity = datetime.utcnow()
             await session.commit()
             await session.refresh(user)
         return user
@@ -95,6 +128,9 @@ async def create_referral_link(session: AsyncSession, user_id: str) -> ReferralL
         await session.commit()
         await session.refresh(new_link)
         
+        # Drop a cached "unknown code" result
+        get_referral_owner.invalidate(ref_code)
+        
         return new_link
     
     except Exception as e:
@@ -104,64 +140,87 @@ async def create_referral_link(session: AsyncSession, user_id: str) -> ReferralL
 
 async def get_referral_link(session: AsyncSession, user_id: str) -> ReferralLink:
     """Get referral link by user ID"""
-    stmt = select(ReferralLink).where(
+    stmt = lambda_stmt(lambda: select(ReferralLink).where(
         ReferralLink.user_id == user_id,
         ReferralLink.is_active == True
-    )
+    ))
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
 
 async def get_referral_link_by_code(session: AsyncSession, ref_code: str) -> ReferralLink:
     """Get referral link by code"""
-    stmt = select(ReferralLink).where(
+    stmt = lambda_stmt(lambda: select(ReferralLink).where(
         ReferralLink.ref_code == ref_code,
         ReferralLink.is_active == True
-    )
+    ))
     result = await session.execute(stmt)
     return result.scalar_one_or_none()
 
 
+@ttl_cache(maxsize=4096, ttl=300)
+async def get_referral_owner(session: AsyncSession, ref_code: str) -> Optional[str]:
+    """Get user ID owning an active referral code (cached, None if unknown)"""
+    stmt = lambda_stmt(lambda: select(ReferralLink.user_id).where(
+        ReferralLink.ref_code == ref_code,
+        ReferralLink.is_active == True
+    ))
+    return await session.scalar(stmt)
+
+
 async def log_referral(session: AsyncSession, referred_user_id: str, ref_code: str) -> bool:
     """Log referral"""
     try:
-        # Find referral link by code
-        ref_link = await get_referral_link_by_code(session, ref_code)
+        # Find referral code owner - cached, so unknown codes skip the DB
+        referrer_id = await get_referral_owner(session, ref_code)
         
-        if not ref_link:
+        if not referrer_id:
             return False
         
-        # Check if user already used this code
-        stmt = select(Referral).where(
-            Referral.referred_user_id == referred_user_id,
-            Referral.ref_code_used == ref_code
+        # Check if user already used this code, and if they are registered
+        stmt = select(
+            exists().where(
+                Referral.referred_user_id == referred_user_id,
+                Referral.ref_code_used == ref_code
+            ).label("used"),
+            exists().where(User.user_id == referred_user_id).label("registered")
         )
-        result = await session.execute(stmt)
-        if result.scalar_one_or_none():
+        row = (await session.execute(stmt)).one()
+        if row.used:
             return False  # Already used
         
+        # Register referred user if not exists - added before the referral
+        # row that references it, since the updates below autoflush
+        if not row.registered:
+            session.add(User(
+                user_id=referred_user_id,
+                username=f"user_{referred_user_id[:8]}",
+                points=0,
+                is_active=True
+            ))
+        
         # Create referral record
         new_referral = Referral(
-            referrer_id=ref_link.user_id,
+            referrer_id=referrer_id,
             referred_user_id=referred_user_id,
             ref_code_used=ref_code,
             points_awarded=10
         )
         session.add(new_referral)
         
-        # Update referrer points
-        referrer = await get_user(session, ref_link.user_id)
-        if referrer:
-            referrer.points += 10
-            referrer.last_activity = datetime.utcnow()
+        # Update referrer points - incremented in SQL, no referrer load
+        await session.execute(
+            update(User)
+            .where(User.user_id == referrer_id)
+            .values(points=User.points + 10)
+        )
         
         # Update referral link uses count
-        ref_link.uses_count += 1
-        
-        # Register referred user if not exists
-        referred_user = await get_user(session, referred_user_id)
-        if not referred_user:
-            await add_user(session, referred_user_id)
+        await session.execute(
+            update(ReferralLink)
+            .where(ReferralLink.ref_code == ref_code)
+            .values(uses_count=ReferralLink.uses_count + 1)
+        )
         
         await session.commit()
         return True
@@ -173,36 +232,56 @@ async def log_referral(session: AsyncSession, referred_user_id: str, ref_code: s
 
 async def get_user_stats(session: AsyncSession, user_id: str) -> dict:
     """Get user statistics"""
-    user = await get_user(session, user_id)
+    # User and referral count in one round-trip
+    referral_count = (
+        select(func.count(Referral.id))
+        .where(Referral.referrer_id == User.user_id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    stmt = select(User, referral_count.label("referral_count")).where(User.user_id == user_id)
+    row = (await session.execute(stmt)).one_or_none()
     
-    if not user:
+    if not row:
         return {}
     
-    # Count referrals
-    stmt = select(func.count(Referral.id)).where(Referral.referrer_id == user_id)
-    result = await session.execute(stmt)
-    referral_count = result.scalar() or 0
+    user, referral_count = row
     
     return {
         "user_id": user.user_id,
         "username": user.username,
         "points": user.points,
-        "referrals": referral_count,
-        "joined_date": user.joined_date.strftime("%Y-%m-%d"),
+        "referrals": referral_count or 0,
+        "joined_date": user.joined_date.strftime("%Y-%m-%d") if user.joined_date else None,
         "is_active": user.is_active
     }
 
 
 async def get_top_referrers(session: AsyncSession, limit: int = 10) -> list:
-    """Get top referrers by points"""
-    stmt = select(User).order_by(desc(User.points)).limit(limit)
+    """Get top referrers by referral count as (user, count) pairs"""
+    # Aggregate on the indexed referrer_id, then join only the top rows
+    counts = (
+        select(Referral.referrer_id, func.count(Referral.id).label("referral_count"))
+        .group_by(Referral.referrer_id)
+        .order_by(desc("referral_count"))
+        .limit(limit)
+        .subquery()
+    )
+    stmt = (
+        select(User, counts.c.referral_count)
+        .join(counts, counts.c.referrer_id == User.user_id)
+        .options(selectinload(User.referral_links), raiseload('*'))
+        .order_by(desc(counts.c.referral_count))
+    )
     result = await session.execute(stmt)
-    return result.scalars().all()
+    return result.all()
 
 
 async def get_referral_count(session: AsyncSession, user_id: str) -> int:
     """Get referral count for user"""
-    stmt = select(func.count(Referral.id)).where(Referral.referrer_id == user_id)
+    stmt = lambda_stmt(
+        lambda: select(func.count(Referral.id)).where(Referral.referrer_id == user_id)
+    )
     result = await session.execute(stmt)
     return result.scalar() or 0
 
@@ -232,6 +311,29 @@ async def create_broadcast(session: AsyncSession, message_text: str) -> Broadcas
         raise e
 
 
+# Rows per multi-VALUES INSERT - 3 params per row stays under SQLite's 999 limit
+RECIPIENT_CHUNK_SIZE = 300
+
+
+async def bulk_insert_recipients(session: AsyncSession, broadcast_id: int, user_ids: list) -> int:
+    """Add broadcast recipients with multi-row INSERTs"""
+    try:
+        for start in range(0, len(user_ids), RECIPIENT_CHUNK_SIZE):
+            chunk = user_ids[start:start + RECIPIENT_CHUNK_SIZE]
+            stmt = insert(BroadcastRecipient).values([
+                {"broadcast_id": broadcast_id, "user_id": user_id}
+                for user_id in chunk
+            ])
+            await session.execute(stmt)
+        
+        await session.commit()
+        return len(user_ids)
+    
+    except Exception as e:
+        await session.rollback()
+        raise e
+
+
 async def get_pending_broadcasts(session: AsyncSession) -> list:
     """Get pending broadcasts"""
     stmt = select(BroadcastMessage).where(
@@ -256,7 +358,7 @@ async def mark_broadcast_completed(session: AsyncSession, broadcast_id: int):
 
 async def get_user_count(session: AsyncSession) -> int:
     """Get total user count"""
-    stmt = select(func.count(User.id))
+    stmt = lambda_stmt(lambda: select(func.count(User.id)))
     result = await session.execute(stmt)
     return result.scalar() or 0
 
@@ -264,6 +366,34 @@ async def get_user_count(session: AsyncSession) -> int:
 async def get_active_user_count(session: AsyncSession, days: int = 7) -> int:
     """Get active users count (last N days)"""
     cutoff_date = datetime.utcnow() - timedelta(days=days)
-    stmt = select(func.count(User.id)).where(User.last_activity >= cutoff_date)
+    stmt = lambda_stmt(
+        lambda: select(func.count(User.id)).where(User.last_activity >= cutoff_date)
+    )
     result = await session.execute(stmt)
     return result.scalar() or 0
+
+
+async def get_total_referral_count(session: AsyncSession) -> int:
+    """Get total referral count"""
+    stmt = lambda_stmt(lambda: select(func.count(Referral.id)))
+    result = await session.execute(stmt)
+    return result.scalar() or 0
+
+
+# Admin dashboard counts - polled often, 30s staleness is fine
+@ttl_cache(ttl=30)
+async def cached_user_count(session: AsyncSession) -> int:
+    """Get total user count (cached)"""
+    return await get_user_count(session)
+
+
+@ttl_cache(ttl=30)
+async def cached_active_user_count(session: AsyncSession, days: int = 7) -> int:
+    """Get active users count (cached)"""
+    return await get_active_user_count(session, days)
+
+
+@ttl_cache(ttl=30)
+async def cached_total_referral_count(session: AsyncSession) -> int:
+    """Get total referral count (cached)"""
+    return await get_total_referral_count(session)
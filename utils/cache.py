@@ -0,0 +1,100 @@
+"""
+In-Memory Caches
+"""
+
+import asyncio
+import functools
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Bounded mapping that evicts least recently used keys"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self._data:
+            self._data.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value and mark key as recently used"""
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key and return its value"""
+        return self._data.pop(key, default)
+
+    def clear(self):
+        """Remove all keys"""
+        self._data.clear()
+
+
+def ttl_cache(maxsize: int = 1024, ttl: float = 300):
+    """Cache results of an async query function for `ttl` seconds
+
+    The first argument (DB session) is not part of the cache key.
+    Positional, keyword and default arguments resolve to the same key.
+    Concurrent misses for the same key wait for a single call.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize)
+        locks = {}
+        signature = inspect.signature(func)
+
+        def make_key(session, args, kwargs):
+            bound = signature.bind(session, *args, **kwargs)
+            bound.apply_defaults()
+            return tuple(bound.arguments.values())[1:]
+
+        def lookup(key):
+            entry = cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry
+            return None
+
+        @functools.wraps(func)
+        async def wrapper(session, *args, **kwargs):
+            key = make_key(session, args, kwargs)
+            entry = lookup(key)
+            if entry is not None:
+                return entry[1]
+
+            lock = locks.setdefault(key, asyncio.Lock())
+            try:
+                async with lock:
+                    # Another caller may have filled it while we waited
+                    entry = lookup(key)
+                    if entry is not None:
+                        return entry[1]
+
+                    value = await func(session, *args, **kwargs)
+                    cache[key] = (time.monotonic() + ttl, value)
+                    return value
+            finally:
+                if not lock.locked():
+                    locks.pop(key, None)
+
+        wrapper.invalidate = lambda *args, **kwargs: cache.pop(make_key(None, args, kwargs))
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
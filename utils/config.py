@@ -3,47 +3,55 @@ Configuration Manager - Load from .env file
 """
 
 import os
+from dataclasses import dataclass
+
 from dotenv import load_dotenv
 
 # Load .env file
 load_dotenv()
 
 
+def _parse_bool(value: str) -> bool:
+    """Parse boolean env value"""
+    return value.lower() == 'true'
+
+
+@dataclass(frozen=True, slots=True)
 class Config:
     """Configuration class"""
     
     # Core
-    BOT_TOKEN = os.getenv('BOT_TOKEN', '')
-    BOT_NAME = os.getenv('BOT_NAME', '')
+    BOT_TOKEN: str
+    BOT_NAME: str
     
     # Database
-    DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///database/bot.db')
+    DATABASE_URL: str = 'sqlite:///database/bot.db'
     
     # Admin
-    ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
-    ADMIN_PORT = int(os.getenv('ADMIN_PORT', 8000))
+    ADMIN_PASSWORD: str = 'admin123'
+    ADMIN_PORT: int = 8000
     
     # Logging
-    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVEL: str = 'INFO'
     
     # Features
-    REQUIRED_CHANNEL = os.getenv('REQUIRED_CHANNEL', '')
-    ENABLE_REFERRAL = os.getenv('ENABLE_REFERRAL', 'true').lower() == 'true'
-    ENABLE_BROADCAST = os.getenv('ENABLE_BROADCAST', 'true').lower() == 'true'
+    REQUIRED_CHANNEL: str = ''
+    ENABLE_REFERRAL: bool = True
+    ENABLE_BROADCAST: bool = True
     
     # Validation
-    MIN_USERNAME_LENGTH = int(os.getenv('MIN_USERNAME_LENGTH', 3))
-    MAX_USERNAME_LENGTH = int(os.getenv('MAX_USERNAME_LENGTH', 32))
+    MIN_USERNAME_LENGTH: int = 3
+    MAX_USERNAME_LENGTH: int = 32
     
     # API
-    REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 30))
-    MAX_MESSAGE_LENGTH = int(os.getenv('MAX_MESSAGE_LENGTH', 4096))
+    REQUEST_TIMEOUT: int = 30
+    MAX_MESSAGE_LENGTH: int = 4096
     
     # Rates
-    POINTS_PER_REFERRAL = int(os.getenv('POINTS_PER_REFERRAL', 10))
-    POINTS_PER_MESSAGE = int(os.getenv('POINTS_PER_MESSAGE', 1))
+    POINTS_PER_REFERRAL: int = 10
+    POINTS_PER_MESSAGE: int = 1
     
-    def __init__(self):
+    def __post_init__(self):
         """Validate configuration"""
         if not self.BOT_TOKEN:
             raise ValueError("BOT_TOKEN not set in .env")
@@ -60,3 +68,29 @@ class Config:
             'LOG_LEVEL': self.LOG_LEVEL,
             'REQUIRED_CHANNEL': self.REQUIRED_CHANNEL,
         }
+
+
+def load_config() -> Config:
+    """Load configuration from environment"""
+    getenv = os.getenv
+    return Config(
+        BOT_TOKEN=getenv('BOT_TOKEN', ''),
+        BOT_NAME=getenv('BOT_NAME', ''),
+        DATABASE_URL=getenv('DATABASE_URL', 'sqlite:///database/bot.db'),
+        ADMIN_PASSWORD=getenv('ADMIN_PASSWORD', 'admin123'),
+        ADMIN_PORT=int(getenv('ADMIN_PORT', 8000)),
+        LOG_LEVEL=getenv('LOG_LEVEL', 'INFO'),
+        REQUIRED_CHANNEL=getenv('REQUIRED_CHANNEL', ''),
+        ENABLE_REFERRAL=_parse_bool(getenv('ENABLE_REFERRAL', 'true')),
+        ENABLE_BROADCAST=_parse_bool(getenv('ENABLE_BROADCAST', 'true')),
+        MIN_USERNAME_LENGTH=int(getenv('MIN_USERNAME_LENGTH', 3)),
+        MAX_USERNAME_LENGTH=int(getenv('MAX_USERNAME_LENGTH', 32)),
+        REQUEST_TIMEOUT=int(getenv('REQUEST_TIMEOUT', 30)),
+        MAX_MESSAGE_LENGTH=int(getenv('MAX_MESSAGE_LENGTH', 4096)),
+        POINTS_PER_REFERRAL=int(getenv('POINTS_PER_REFERRAL', 10)),
+        POINTS_PER_MESSAGE=int(getenv('POINTS_PER_MESSAGE', 1))
+    )
+
+
+# Shared configuration, loaded once at import
+CONFIG = load_config()
@@ -2,18 +2,28 @@
 Referral Link Generator
 """
 
+import base64
 import hashlib
+import re
 import secrets
 import string
 from typing import Optional, Tuple
 from urllib.parse import quote, unquote
 
+import orjson
+
+# Characters allowed in referral codes
+_REF_ALLOWED = frozenset(string.ascii_letters + string.digits + '_')
+
+# Deep link payload: ref_CODE_userid
+_REF_PAYLOAD_RE = re.compile(r'ref_([^_]*)')
+
 
 def generate_short_code(length: int = 8) -> str:
     """Generate short referral code"""
-    chars = string.ascii_letters + string.digits
-    code = ''.join(secrets.choice(chars) for _ in range(length))
-    return code.upper()
+    # Base32 of random bytes is already uppercase alphanumeric (A-Z, 2-7)
+    raw = secrets.token_bytes((length * 5 + 7) // 8)
+    return base64.b32encode(raw).decode('ascii').rstrip('=')[:length]
 
 
 def generate_referral_link(user_id: str, bot_name: str, code: str = None) -> str:
@@ -37,11 +47,8 @@ def extract_referral_code(payload: str) -> Optional[str]:
         return None
     
     # Try to extract from format: ref_CODE_userid
-    parts = payload.split('_')
-    if len(parts) >= 2 and parts[0] == 'ref':
-        return parts[1]
-    
-    return None
+    match = _REF_PAYLOAD_RE.match(payload)
+    return match.group(1) if match else None
 
 
 def is_valid_referral_format(ref_code: str) -> bool:
@@ -50,13 +57,13 @@ def is_valid_referral_format(ref_code: str) -> bool:
         return False
     
     # Allow alphanumeric and underscore
-    allowed = set(string.ascii_letters + string.digits + '_')
-    return all(c in allowed for c in ref_code) and 3 <= len(ref_code) <= 20
+    return 3 <= len(ref_code) <= 20 and _REF_ALLOWED.issuperset(ref_code)
 
 
 def hash_user_id(user_id: str) -> str:
     """Hash user ID for tracking"""
-    return hashlib.sha256(user_id.encode()).hexdigest()[:16]
+    # 8-byte digest gives the 16 hex chars directly, no truncation
+    return hashlib.blake2b(user_id.encode(), digest_size=8).hexdigest()
 
 
 def generate_tracking_link(
@@ -75,8 +82,8 @@ def parse_start_parameter(start_param: str) -> Tuple[Optional[str], Optional[str
     if not start_param:
         return None, None
     
-    # Format: CODE or CODE_metadata
-    parts = start_param.split('_')
+    # Format: CODE or CODE_metadata - only the first two parts are used
+    parts = start_param.split('_', 2)
     code = parts[0] if parts else None
     metadata = parts[1] if len(parts) > 1 else None
     
@@ -110,16 +117,12 @@ def validate_referral_code(code: str) -> bool:
 
 def encode_payload(data: dict) -> str:
     """Encode dictionary as URL-safe payload"""
-    import json
-    json_str = json.dumps(data)
-    return quote(json_str)
+    return quote(orjson.dumps(data))
 
 
 def decode_payload(payload: str) -> dict:
     """Decode URL-safe payload to dictionary"""
-    import json
     try:
-        json_str = unquote(payload)
-        return json.loads(json_str)
-    except:
+        return orjson.loads(unquote(payload))
+    except orjson.JSONDecodeError:
         return {}